@@ -3,48 +3,163 @@
 import os
 import json
 import time
-import shutil
-import subprocess
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from hashlib import sha256
-from typing import Dict, List
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from bitcointx.core.script import CScript, OP_SHA256, OP_EQUAL
+
+from challenge_psbt import build_challenge_psbt
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import PatternMatchingEventHandler
+except ImportError:
+    Observer = None
 
 ROLLUP_DB = Path("rollup_block_db")
 ROLLUP_DB.mkdir(exist_ok=True)
+ROLLUP_DB_FILE = "rollup_blocks.sqlite"
 
-HISTORY_FILE = Path("ipfs_commit_history.json")
+HISTORY_FILE = Path("ipfs_commit_history.jsonl")
+LEGACY_HISTORY_FILE = Path("ipfs_commit_history.json")
 
+IPFS_API_URL = os.getenv("IPFS_API_URL", "http://127.0.0.1:5001/api/v0")
 IPFS_CLUSTER_URL = os.getenv("IPFS_CLUSTER_URL", "http://127.0.0.1:9094/pins")
+IPFS_TIMEOUT = (1, 60)  # (connect, read) seconds; a missing daemon fails fast instead of stalling
 BITCOIND_RPC_URL = os.getenv("BITCOIND_RPC_URL", "http://127.0.0.1:8332")
 BITCOIND_RPC_USER = os.getenv("BITCOIND_RPC_USER", "user")
 BITCOIND_RPC_PASS = os.getenv("BITCOIND_RPC_PASS", "password")
+BITCOIND_TIMEOUT = (3, 30)  # (connect, read) seconds per attempt; a hung node can't block __init__
+
+# Taproot internal key (hex) for challenge outputs; blocks supply the UTXO to spend
+CHALLENGE_INTERNAL_PUBKEY = os.getenv("BITVM_INTERNAL_PUBKEY")
+CHALLENGE_FEE_SATS = int(os.getenv("BITVM_CHALLENGE_FEE", "1000"))
+CHALLENGE_UTXO_FIELDS = {"txid", "vout", "amount_sats"}
+
+UTXO_BATCH_SIZE = 500  # addresses per listunspent call
+
+# Verification is a pure function of the chain, so a chain seen again (a block that is
+# re-challenged after its proof, or the same chain in several blocks) skips the N-hash walk.
+# Every call, hit or miss, still pays one hash over the serialized chain for the key;
+# keying on that digest keeps the cache from pinning whole chains.
+VERIFY_CACHE_SIZE = 4096
+_verify_cache: "OrderedDict[bytes, int]" = OrderedDict()
+_verify_cache_lock = threading.Lock()
+
+def _first_bad_step(steps: List[str], decoded: Optional[Tuple[List[bytes], int]] = None) -> int:
+    """Return the index of the first step that is not the SHA256 of the one before it, or -1.
+    Pass decoded=_decode_steps(steps) when the caller already has the bytes."""
+    key = sha256(_canonical(list(steps))).digest()
+    with _verify_cache_lock:
+        if key in _verify_cache:
+            _verify_cache.move_to_end(key)
+            return _verify_cache[key]
+    raw, undecodable = decoded if decoded is not None else _decode_steps(steps)
+    bad = _first_bad_link(raw)
+    bad = bad if bad >= 0 else undecodable
+    with _verify_cache_lock:
+        _verify_cache[key] = bad
+        if len(_verify_cache) > VERIFY_CACHE_SIZE:
+            _verify_cache.popitem(last=False)
+    return bad
+
+def _decode_steps(steps: Iterable[str]) -> Tuple[List[bytes], int]:
+    """Decode hex steps up to the first one that is not valid hex.
+    Returns the decoded steps and the index of the undecodable one, or -1."""
+    raw = []
+    for i, step in enumerate(steps):
+        try:
+            raw.append(bytes.fromhex(step))
+        except (TypeError, ValueError):
+            return raw, i
+    return raw, -1
+
+def _first_bad_link(raw: List[bytes]) -> int:
+    """Return the index of the first decoded step that is not the SHA256 of its
+    predecessor, or -1. A step of the wrong length simply fails the comparison."""
+    hash_ = sha256
+    for i in range(1, len(raw)):
+        if hash_(raw[i - 1]).digest() != raw[i]:
+            return i
+    return -1
+
+def _commit(parts: Iterable[str]) -> bytes:
+    """SHA256 of the concatenated parts, fed to the hasher one part at a time."""
+    h = sha256()
+    for part in parts:
+        h.update(part.encode())
+    return h.digest()
+
+def _canonical(obj) -> bytes:
+    """Compact, key-sorted JSON from the stdlib encoder. Block ids hash these bytes, so they
+    must not depend on whether orjson is installed (its floats and key handling differ)."""
+    return json.dumps(obj, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode()
+
+def _dumps(obj, indent: bool = False) -> bytes:
+    """Serialize obj to key-sorted JSON bytes, using orjson when it is installed."""
+    if orjson is not None:
+        option = orjson.OPT_SORT_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(obj, option=option)
+    if indent:
+        return json.dumps(obj, sort_keys=True, indent=2, ensure_ascii=False).encode()
+    return _canonical(obj)
+
+_loads = orjson.loads if orjson is not None else json.loads
+
+def _load_block(data) -> Dict:
+    """Parse block JSON with the stdlib decoder, which keeps integers wider than
+    64 bits exact where orjson would turn them into floats."""
+    return json.loads(data)
+
+def _write_atomic(path: Path, data: bytes):
+    """Write data to a sibling temp file and rename it over path, so readers never see a partial file."""
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
 
 class BitVMProofBuilder:
     def fetch_from_ipfs(self, ipfs_hash: str) -> Dict:
         try:
-            result = subprocess.run(["ipfs", "get", ipfs_hash, "-o", "_ipfs_block.json"], capture_output=True)
-            with open("_ipfs_block.json") as f:
-                block_data = json.load(f)
-            os.remove("_ipfs_block.json")
+            response = self._session.post(f"{IPFS_API_URL}/cat", params={"arg": ipfs_hash}, timeout=IPFS_TIMEOUT)
+            response.raise_for_status()
+            block_data = _load_block(response.content)
             expected = ipfs_hash[:16]
-            actual = sha256(json.dumps(block_data).encode()).hexdigest()[:16]
+            actual = self.store_rollup_block(block_data)
             if expected != actual:
                 print(f" Hash mismatch: expected {expected}, got {actual}")
             else:
                 print(f" IPFS hash matches block content: {actual}")
-            self.store_rollup_block(block_data, block_id=actual)
             return block_data
         except Exception as e:
             print(f" IPFS fetch failed: {e}")
             return {}
 
     def pin_to_ipfs(self, ipfs_hash: str):
+        # Local pin and cluster request are independent, so run them side by side
+        local = self._pool.submit(self._session.post, f"{IPFS_API_URL}/pin/add", params={"arg": ipfs_hash},
+                                   timeout=IPFS_TIMEOUT)
+        cluster = self._pool.submit(self._session.post, IPFS_CLUSTER_URL, json={"cid": ipfs_hash},
+                                     timeout=IPFS_TIMEOUT)
         try:
-            subprocess.run(["ipfs", "pin", "add", ipfs_hash], check=True)
+            local.result().raise_for_status()
             print(f" IPFS hash pinned locally: {ipfs_hash}")
-            response = requests.post(IPFS_CLUSTER_URL, json={"cid": ipfs_hash})
+        except Exception as e:
+            print(f" IPFS pinning error: {e}")
+        try:
+            response = cluster.result()
             if response.status_code == 202:
                 print(f"🔗 Cluster pin request accepted for: {ipfs_hash}")
             else:
@@ -53,140 +168,302 @@ class BitVMProofBuilder:
             print(f" IPFS pinning error: {e}")
 
     def fetch_utxos(self, address: str) -> List[Dict]:
+        return self.fetch_utxos_many([address]).get(address, [])
+
+    def fetch_utxos_many(self, addresses: List[str]) -> Dict[str, List[Dict]]:
+        """Fetch UTXOs for all addresses with one listunspent call, bucketed per address"""
+        utxos = {addr: [] for addr in addresses}
+        if not addresses:
+            return utxos
         try:
             payload = {
                 "jsonrpc": "1.0",
                 "id": "curltest",
                 "method": "listunspent",
-                "params": [0, 9999999, [address]]
+                "params": [0, 9999999, list(addresses)]
             }
-            response = requests.post(
+            response = self._session.post(
                 BITCOIND_RPC_URL,
                 auth=(BITCOIND_RPC_USER, BITCOIND_RPC_PASS),
                 headers={"content-type": "application/json"},
-                data=json.dumps(payload)
+                data=_dumps(payload),
+                timeout=BITCOIND_TIMEOUT
             )
             result = response.json()
-            return result.get("result", [])
+            for utxo in result.get("result") or []:
+                utxos.setdefault(utxo.get("address"), []).append(utxo)
         except Exception as e:
             print(f" UTXO fetch failed: {e}")
-            return []
+        return utxos
 
     def __init__(self, db_path=ROLLUP_DB):
         self.history = self.load_history()
         self.db_path = db_path
+        # One connection shared by the watcher and callers on other threads; _db_lock serializes it
+        self._db = sqlite3.connect(str(db_path / ROLLUP_DB_FILE), isolation_level=None, check_same_thread=False)
+        self._db_lock = threading.Lock()
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS blocks ("
+            "id TEXT PRIMARY KEY, challenged INTEGER NOT NULL, proof_generated INTEGER NOT NULL, data BLOB NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_pending ON blocks(challenged, proof_generated)")
+        self._import_json_blocks()
+        self._wake = threading.Event()
+        self._history_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._pool = ThreadPoolExecutor(max_workers=16)
+        self._rpc = None
+        self._session = requests.Session()
+        # Only bitcoind gets retries; IPFS is optional and should fail at once when absent
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=32, max_retries=0)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._session.mount(BITCOIND_RPC_URL, HTTPAdapter(max_retries=Retry(total=3, backoff_factor=0.2)))
         self.auto_update_utxo_state()
 
+    def get_rpc(self):
+        """Return the shared bitcoind RawProxy, creating it on first use"""
+        if self._rpc is None:
+            from bitcoin.rpc import RawProxy
+            self._rpc = RawProxy()
+        return self._rpc
+
     def auto_update_utxo_state(self):
         tracked_addresses = set()
-        for block_file in self.list_blocks():
-            block = self.load_block(block_file.split("_")[2].split(".")[0])
-            for output in block.get("outputs", []):
+        for (data,) in self._query("SELECT data FROM blocks"):
+            for output in _load_block(data).get("outputs", []):
                 addr = output.get("address")
                 if addr:
                     tracked_addresses.add(addr)
 
         print(f" Auto-updating UTXO state for {len(tracked_addresses)} addresses...")
-        for addr in tracked_addresses:
-            utxos = self.fetch_utxos(addr)
-            print(f"💰 {addr}: {len(utxos)} UTXO(s)")
+        addresses = sorted(tracked_addresses)
+        batches = [addresses[i:i + UTXO_BATCH_SIZE] for i in range(0, len(addresses), UTXO_BATCH_SIZE)]
+        for utxos_by_addr in self._pool.map(self.fetch_utxos_many, batches):
+            for addr, utxos in utxos_by_addr.items():
+                print(f"💰 {addr}: {len(utxos)} UTXO(s)")
 
     def load_history(self):
+        if not HISTORY_FILE.exists() and LEGACY_HISTORY_FILE.exists():
+            # One-time conversion from the old single-array format
+            with open(LEGACY_HISTORY_FILE) as f:
+                entries = json.load(f)
+            _write_atomic(HISTORY_FILE, b"".join(_dumps(entry) + b"\n" for entry in entries))
         if HISTORY_FILE.exists():
-            with open(HISTORY_FILE) as f:
-                return json.load(f)
+            with open(HISTORY_FILE, "rb") as f:
+                return [_loads(line) for line in f if line.strip()]
         return []
 
-    def save_history(self):
-        with open(HISTORY_FILE, "w") as f:
-            json.dump(self.history, f, indent=2)
+    def append_history(self, entry: Dict):
+        """Record a commit in memory and append it to the history file as one JSON line"""
+        with self._history_lock:
+            self.history.append(entry)
+            with open(HISTORY_FILE, "ab") as f:
+                f.write(_dumps(entry) + b"\n")
 
     def store_rollup_block(self, block_data: Dict, block_id: str = None):
-        if shutil.which("ipfs"):
-            tmp_path = Path("_tmp_block.json")
-            with open(tmp_path, "w") as f:
-                json.dump(block_data, f)
-            result = subprocess.run(["ipfs", "add", "-q", str(tmp_path)], capture_output=True)
-            ipfs_hash = result.stdout.decode().strip()
+        data = _canonical(block_data)
+        block_id = block_id or sha256(data).hexdigest()[:16]
+        self._put_block(block_id, block_data, data)
+        print(f" Stored rollup block: {block_id}")
+        try:
+            response = self._session.post(
+                f"{IPFS_API_URL}/add",
+                params={"quiet": "true"},
+                files={"file": ("block.json", data)},
+                timeout=IPFS_TIMEOUT
+            )
+            response.raise_for_status()
+            ipfs_hash = response.json()["Hash"]
             self.pin_to_ipfs(ipfs_hash)
             print(f" IPFS Hash: {ipfs_hash}")
-            self.history.append({"ipfs_hash": ipfs_hash, "timestamp": time.time()})
-            self.save_history()
-            tmp_path.unlink()
-        block_id = block_id or sha256(json.dumps(block_data).encode()).hexdigest()[:16]
-        path = self.db_path / f"rollup_block_{block_id}.json"
-        with open(path, "w") as f:
-            json.dump(block_data, f, indent=2)
-        print(f" Stored rollup block: {path.name}")
+            self.append_history({"ipfs_hash": ipfs_hash, "timestamp": time.time()})
+        except requests.RequestException as e:
+            print(f" IPFS add failed: {e}")
         return block_id
 
+    def _put_block(self, block_id: str, block_data: Dict, data: bytes = None, or_ignore: bool = False):
+        """Upsert a block (or keep an existing row with or_ignore) as _canonical JSON; the flag
+        columns mirror the JSON fields so the pending scan is an index lookup"""
+        row = (
+            block_id,
+            int(bool(block_data.get("challenged"))),
+            int(bool(block_data.get("proof_generated"))),
+            data if data is not None else _canonical(block_data),
+        )
+        with self._db_lock:
+            self._db.execute(f"INSERT OR {'IGNORE' if or_ignore else 'REPLACE'} INTO blocks VALUES (?, ?, ?, ?)", row)
+
+    def _query(self, sql: str, params: Tuple = ()) -> List[Tuple]:
+        """Run a SELECT and fetch every row while holding the connection lock"""
+        with self._db_lock:
+            return self._db.execute(sql, params).fetchall()
+
     def list_blocks(self) -> List[str]:
-        return sorted([f.name for f in self.db_path.glob("rollup_block_*.json")])
+        return [block_id for (block_id,) in self._query("SELECT id FROM blocks ORDER BY id")]
 
     def load_block(self, block_id: str) -> Dict:
-        path = self.db_path / f"rollup_block_{block_id}.json"
-        with open(path) as f:
-            return json.load(f)
+        rows = self._query("SELECT data FROM blocks WHERE id = ?", (block_id,))
+        if not rows:
+            raise KeyError(block_id)
+        return _load_block(rows[0][0])
+
+    def mark_challenged(self, block_id: str):
+        """Flag a block as challenged (clearing any earlier proof) and wake the watcher"""
+        with self._db_lock:
+            row = self._db.execute("SELECT data FROM blocks WHERE id = ?", (block_id,)).fetchone()
+            if row is None:
+                raise KeyError(block_id)
+            block = _load_block(row[0])
+            block["challenged"] = True
+            block["proof_generated"] = False
+            self._db.execute(
+                "UPDATE blocks SET challenged = 1, proof_generated = 0, data = ? WHERE id = ?",
+                (_canonical(block), block_id)
+            )
+        self._wake.set()
+
+    def export_json(self, out_dir: Path = None) -> List[Path]:
+        """Dump every block to a pretty-printed rollup_block_<id>.json file for debugging"""
+        out_dir = out_dir or self.db_path / "export"
+        out_dir.mkdir(parents=True, exist_ok=True)
+        paths = []
+        for block_id, data in self._query("SELECT id, data FROM blocks ORDER BY id"):
+            path = out_dir / f"rollup_block_{block_id}.json"
+            pretty = json.dumps(_load_block(data), sort_keys=True, indent=2, ensure_ascii=False)
+            _write_atomic(path, pretty.encode())
+            paths.append(path)
+        print(f" Exported {len(paths)} block(s) to {out_dir}")
+        return paths
+
+    def _import_json_blocks(self):
+        """Pull in blocks left as rollup_block_<id>.json files by earlier versions. Each file is
+        imported once; later edits to it are ignored, so flag challenges with mark_challenged"""
+        for path in self.db_path.glob("rollup_block_*.json"):
+            block_id = path.stem[len("rollup_block_"):]
+            if "_" in block_id:  # proof/log exports, not blocks
+                continue
+            try:
+                block_data = _load_block(path.read_bytes())
+                if not isinstance(block_data, dict):
+                    raise ValueError("not a JSON object")
+            except (OSError, ValueError) as e:
+                print(f" Skipping unreadable block file {path.name}: {e}")
+                continue
+            self._put_block(block_id, block_data, or_ignore=True)
+
+    def _process_pending(self):
+        """Process every open challenge"""
+        pending = [
+            (block_id, _load_block(data)) for block_id, data in self._query(
+                "SELECT id, data FROM blocks WHERE challenged = 1 AND proof_generated = 0"
+            )
+        ]
+        for block_id, block in pending:
+            self.process_challenge(block_id, block)
 
     def watch_for_challenges(self, interval=5):
         print("👁️ Watching for challenge requests...")
-        while True:
-            for block_file in self.db_path.glob("rollup_block_*.json"):
-                with open(block_file) as f:
-                    block = json.load(f)
-                    if block.get("challenged") and not block.get("proof_generated"):
-                        self.process_challenge(block, block_file)
-            time.sleep(interval)
-
-    def process_challenge(self, block: Dict, file_path: Path):
+        self._process_pending()
+        if Observer is None:
+            # No watchdog installed: fall back to polling
+            while not self._stop.wait(interval):
+                self._process_pending()
+            return
+
+        # Any write to the database (or its WAL) may have flagged a challenge
+        handler = PatternMatchingEventHandler(patterns=[f"*{ROLLUP_DB_FILE}*"], ignore_directories=True)
+        handler.on_any_event = lambda event: self._wake.set()
+        observer = Observer()
+        observer.schedule(handler, str(self.db_path), recursive=False)
+        observer.start()
+        try:
+            while True:
+                self._wake.wait()
+                self._wake.clear()
+                if self._stop.is_set():
+                    break
+                self._process_pending()
+        finally:
+            observer.stop()
+            observer.join()
+
+    def stop(self):
+        """Ask watch_for_challenges to return"""
+        self._stop.set()
+        self._wake.set()
+
+    def process_challenge(self, block_id: str, block: Dict):
         """Process a single challenge and export proof + PSBT"""
-        print(f"⚔️ Processing challenge on block {file_path.name}")
+        name = f"rollup_block_{block_id}"
+        print(f"⚔️ Processing challenge on block {name}")
         step_data = block.get("step_chain", [])
-        verified = all(
-            sha256(bytes.fromhex(step_data[i])).hexdigest() == step_data[i + 1]
-            for i in range(len(step_data) - 1)
-        )
+        # Decode once; the bytes feed both verification and the PSBT leaves
+        decoded = _decode_steps(step_data)
+        raw_steps = decoded[0]
+        first_bad = _first_bad_step(step_data, decoded)
+        verified = first_bad < 0
         block["proof_verified"] = verified
         block["proof_generated"] = True
-        with open(file_path, "w") as f:
-            json.dump(block, f, indent=2)
-                print(f" Proof {'valid' if verified else 'invalid'} for {file_path.name}")
+        self._put_block(block_id, block)
+        proof = {"proof_steps": block.get("step_chain"), "verified": verified}
+        if verified:
+            print(f" Proof valid for {name}")
+        else:
+            proof["first_invalid_step"] = first_bad
+            print(f" Proof invalid for {name} at step {proof['first_invalid_step']}")
 
         # Export proof to JSON
-        proof_out = file_path.with_name(file_path.stem + "_proof.json")
-        with open(proof_out, "w") as f:
-            json.dump({"proof_steps": block.get("step_chain"), "verified": verified}, f, indent=2)
+        proof_out = self.db_path / f"{name}_proof.json"
+        _write_atomic(proof_out, _dumps(proof, indent=True))
         print(f"📄 Exported proof to {proof_out.name}")
 
-        # Generate Taproot PSBT (if external generator installed)
-        script_tree = {
-            "tapleaf_tree": [
-                {
-                    "name": f"step_{i}",
-                    "script": f"OP_SHA256 {step} OP_EQUAL",
-                    "tapleaf_version": "c0"
-                } for i, step in enumerate(block.get("step_chain", []))
-            ]
-        }
-        psbt_out = file_path.with_name(file_path.stem + "_challenge.psbt")
-        tree_file = file_path.with_name(file_path.stem + "_tree.json")
-        with open(tree_file, "w") as f:
-            json.dump(script_tree, f, indent=2)
+        # Generate Taproot PSBT with one OP_SHA256 leaf per step
+        psbt_out = self.db_path / f"{name}_challenge.psbt"
         op_returns = block.get("ipfs_hashes") or [block.get("ipfs_hash")]
         op_returns = [h for h in op_returns if h]
         if len(op_returns) > 4:
             print(f" Too many IPFS hashes for OP_RETURN ({len(op_returns)}), truncating to 4.")
             op_returns = op_returns[:4]
-        op_return_script = ' '.join(op_returns)[:80]  # truncate if too long
-        os.system(f"taproot-psbt-generator --tree {tree_file} --output {psbt_out} --op_return {op_return_script}")
+        op_return_payload = ' '.join(op_returns).encode()[:80]  # truncate if too long
+        utxo = block.get("challenge_utxo")
+        psbt_written = False
+        if not raw_steps:
+            print(f" No step chain on {name}, skipping PSBT")
+        elif not CHALLENGE_INTERNAL_PUBKEY:
+            print(f" BITVM_INTERNAL_PUBKEY not set, skipping PSBT for {name}")
+        elif not isinstance(utxo, dict) or not CHALLENGE_UTXO_FIELDS <= utxo.keys():
+            print(f" challenge_utxo on {name} needs {', '.join(sorted(CHALLENGE_UTXO_FIELDS))}, skipping PSBT")
+        else:
+            try:
+                leaves = [CScript([OP_SHA256, raw, OP_EQUAL]) for raw in raw_steps]
+                psbt = build_challenge_psbt(
+                    leaves,
+                    op_return_payload,
+                    internal_pub=bytes.fromhex(CHALLENGE_INTERNAL_PUBKEY),
+                    prev_txid=utxo["txid"],
+                    prev_vout=utxo["vout"],
+                    amount_sats=utxo["amount_sats"],
+                    fee=CHALLENGE_FEE_SATS
+                )
+                _write_atomic(psbt_out, psbt.serialize())
+                psbt_written = True
                 print(f" Generated PSBT: {psbt_out.name}")
+            except Exception as e:
+                print(f" PSBT generation failed for {name}: {e}")
+
+        if not psbt_written:
+            # Never sign a _challenge.psbt left over from an earlier run
+            print(f" No PSBT generated for {name}, skipping signing")
+            return
 
         # Automatically sign PSBT using HWI and broadcast
         try:
             import subprocess
-            signed_psbt = file_path.with_name(file_path.stem + "_signed.psbt")
-            final_tx = file_path.with_name(file_path.stem + "_final.tx")
-            log_file = file_path.with_name(file_path.stem + "_log.json")
+            signed_psbt = self.db_path / f"{name}_signed.psbt"
+            final_tx = self.db_path / f"{name}_final.tx"
+            log_file = self.db_path / f"{name}_log.json"
 
             subprocess.run(["hwi", "--device-type", "ledger", "signtx", "--psbt", str(psbt_out), "--out", str(signed_psbt)], check=True)
             subprocess.run(["hwi", "--device-type", "ledger", "finalizetx", "--psbt", str(signed_psbt), "--out", str(final_tx)], check=True)
@@ -194,8 +471,7 @@ class BitVMProofBuilder:
             with open(final_tx) as f:
                 tx_hex = f.read().strip()
 
-            from bitcoin.rpc import RawProxy
-            rpc = RawProxy()
+            rpc = self.get_rpc()
             txid = rpc.sendrawtransaction(tx_hex)
             print(f"📡 Broadcasted TXID: {txid}")
 
@@ -203,6 +479,12 @@ class BitVMProofBuilder:
             sighash = sha256(tx_hex.encode()).hexdigest()
             print(f" Sighash: {sighash}")
 
+            # Commitment over the block's IPFS hashes, or its step chain if it has none
+            ipfs_hashes = block.get("ipfs_hashes") or [block.get("ipfs_hash")]
+            ipfs_hashes = [h for h in ipfs_hashes if h]
+            ipfs_hash = ipfs_hashes[0] if ipfs_hashes else None
+            commitment = _commit(ipfs_hashes if ipfs_hash else block.get("step_chain", []))
+
             tx_info = rpc.getrawtransaction(txid, True)
             outputs = tx_info.get("vout", [])
             found_opreturn = False
@@ -215,24 +497,14 @@ class BitVMProofBuilder:
             if not found_opreturn:
                 print(" OP_RETURN commitment NOT found in tx outputs")
 
-            # Append OP_RETURN with commitment hash
-            ipfs_hashes = block.get("ipfs_hashes") or [block.get("ipfs_hash")]
-            ipfs_hashes = [h for h in ipfs_hashes if h]
-            ipfs_hash = ipfs_hashes[0] if ipfs_hashes else None
-            if ipfs_hash:
-                combined_data = ''.join(ipfs_hashes)
-                commitment = sha256(combined_data.encode()).digest()
-            else:
-            commitment = sha256(''.join(block.get("step_chain", [])).encode()).digest()
-                        log = {
+            log = {
                 "ipfs_hash": ipfs_hash if ipfs_hash else "N/A",
                 "txid": txid,
                 "commitment": commitment.hex(),
                 "timestamp": time.time()
             }
-            with open(log_file, "w") as f:
-                json.dump(log, f, indent=2)
-                        log["sighash"] = sighash
+            _write_atomic(log_file, _dumps(log, indent=True))
+            log["sighash"] = sighash
             print(f" Proof log saved: {log_file.name}")
         except Exception as e:
             print(f" Signing/Broadcasting failed: {e}")
@@ -290,30 +562,23 @@ if __name__ == "__main__":
         dot_path = Path("ipfs_graph.dot")
         mermaid_path = Path("ipfs_graph.mmd")
         with open(dot_path, "w") as f:
-            f.write("digraph IPFSGraph {
-")
+            f.write("digraph IPFSGraph {\n")
             for i, entry in enumerate(prover.history[-10:]):
                 node = f"\"{entry['ipfs_hash'][:16]}\""
-                f.write(f"  {node};
-")
+                f.write(f"  {node};\n")
                 if i > 0:
                     prev = f"\"{prover.history[i-1]['ipfs_hash'][:16]}\""
-                    f.write(f"  {prev} -> {node};
-")
-            f.write("}
-")
+                    f.write(f"  {prev} -> {node};\n")
+            f.write("}\n")
 
         with open(mermaid_path, "w") as f:
-            f.write("graph TD
-")
+            f.write("graph TD\n")
             for i, entry in enumerate(prover.history[-10:]):
                 node = entry['ipfs_hash'][:16]
-                f.write(f"  {node}
-")
+                f.write(f"  {node}\n")
                 if i > 0:
                     prev = prover.history[i-1]['ipfs_hash'][:16]
-                    f.write(f"  {prev} --> {node}
-")
+                    f.write(f"  {prev} --> {node}\n")
         print(f" Exported IPFS graph to {dot_path.name} and {mermaid_path.name}")
 
     # Example: add a block manually
@@ -1,37 +1,170 @@
 # psbtlib.py — Utility to generate, sign, and broadcast punishment PSBT
-from bitcointx.wallet import PSBT, PSBTInput, PSBTOutput
-from bitcointx.core import COutPoint, CTxOut, CScript, lx
+from bitcointx.core import COutPoint, CMutableTransaction, CTxIn, CTxOut, lx
 from bitcointx.core.key import CPubKey
-from bitcointx.core.script import OP_CHECKSIG
+from bitcointx.core.psbt import PartiallySignedTransaction as PSBT
+from bitcointx.core.script import CScript, OP_CHECKSIG
 from bitcointx import select_chain_params
 import base64
 import json
 import os
 import subprocess
+import threading
+import time
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor, wait
 from bitcoin.rpc import RawProxy
 
-select_chain_params('testnet')
-BITCOIN_RPC = RawProxy()
+select_chain_params('bitcoin/testnet')
+PUNISHMENT_LOG = "punishment_log.jsonl"  # one JSON object per line, append-only
+LEGACY_PUNISHMENT_LOG = "punishment_log.json"
+
+# Sign -> broadcast -> verify run as separate stages so a slow HWI call for one
+# punishment overlaps the broadcast and on-chain check of the previous one.
+# There is a single hardware wallet, so every HWI call (sign and finalize)
+# stays on the one signer thread.
+_signer = ThreadPoolExecutor(max_workers=1)
+_broadcaster = ThreadPoolExecutor(max_workers=2)
+_verifier = ThreadPoolExecutor(max_workers=2)
+_log_lock = threading.Lock()
+_in_flight = set()
+_in_flight_lock = threading.Lock()
+_local = threading.local()
+
+def _rpc():
+    """RawProxy is not thread-safe; give each broadcaster/verifier thread its own."""
+    if not hasattr(_local, "rpc"):
+        _local.rpc = RawProxy()
+    return _local.rpc
+
+def _then(future, executor, fn, *args):
+    """Once `future` succeeds, run fn(result, *args) on `executor`; failures skip ahead.
+    The returned future always resolves, even if a stage is cancelled or the executor is shut down."""
+    chained = Future()
+
+    def _copy(inner):
+        if inner.cancelled():
+            chained.set_exception(CancelledError())
+        elif inner.exception() is not None:
+            chained.set_exception(inner.exception())
+        else:
+            chained.set_result(inner.result())
+
+    def _start(done):
+        if done.cancelled() or done.exception() is not None:
+            _copy(done)
+            return
+        try:
+            executor.submit(fn, done.result(), *args).add_done_callback(_copy)
+        except Exception as e:  # e.g. RuntimeError after shutdown
+            chained.set_exception(e)
+
+    future.add_done_callback(_start)
+    return chained
+
+def _report_failure(future):
+    if future.exception() is not None:
+        print(f" HWI signing or broadcasting failed: {future.exception()}")
+
+def _forget(future):
+    with _in_flight_lock:
+        _in_flight.discard(future)
+
+def wait_for_punishments(timeout=None):
+    """Block until every punishment submitted so far has been signed, broadcast and logged."""
+    with _in_flight_lock:
+        pending = list(_in_flight)
+    wait(pending, timeout=timeout)
+
+def _convert_legacy_log(save_path):
+    """One-time conversion from the old single-array punishment_log.json."""
+    log_path = os.path.join(save_path, PUNISHMENT_LOG)
+    legacy_path = os.path.join(save_path, LEGACY_PUNISHMENT_LOG)
+    if os.path.exists(log_path) or not os.path.exists(legacy_path):
+        return
+    with open(legacy_path) as f:
+        entries = json.load(f)
+    tmp_path = log_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.writelines(json.dumps(entry) + "\n" for entry in entries)
+    os.replace(tmp_path, log_path)
+
+def load_punishment_log(save_path="."):
+    """Read back every entry appended to the punishment log."""
+    with _log_lock:
+        _convert_legacy_log(save_path)
+    log_path = os.path.join(save_path, PUNISHMENT_LOG)
+    if not os.path.exists(log_path):
+        return []
+    with open(log_path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def _sign(psbt_b64, signed_filename):
+    signed = subprocess.check_output([
+        "hwi", "--device-path", "/dev/hidraw0", "signtx", "--psbt", psbt_b64
+    ]).decode()
+    with open(signed_filename, "w") as f:
+        f.write(signed)
+
+    # Extract final tx while still on the signer thread
+    final_tx = subprocess.check_output([
+        "hwi", "--device-path", "/dev/hidraw0", "finalizepsbt", "--psbt", signed
+    ]).decode()
+
+    tx_hex = json.loads(final_tx).get("hex")
+    if not tx_hex:
+        raise ValueError("Could not finalize PSBT to hex")
+    return tx_hex
+
+def _broadcast(tx_hex):
+    txid = _rpc().sendrawtransaction(tx_hex)
+    print(f" Broadcasted TXID: {txid}")
+    return txid
+
+def _verify_and_log(txid, save_path):
+    # Verify UTXO broadcast
+    tx_details = {}
+    try:
+        tx_details = _rpc().getrawtransaction(txid, True)
+        if tx_details:
+            print(f" Verified on-chain UTXO: {txid} with outputs:")
+            for i, vout in enumerate(tx_details['vout']):
+                print(f"  → Output {i}: {vout['value']} BTC to {vout['scriptPubKey']['address'] if 'address' in vout['scriptPubKey'] else 'script'}")
+    except Exception as e:
+        print(f" Could not verify UTXO on-chain: {e}")
+
+    # Log results
+    try:
+        log_path = os.path.join(save_path, PUNISHMENT_LOG)
+        log_entry = {
+            "txid": txid,
+            "timestamp": int(time.time()),
+            "outputs": tx_details.get("vout", [])
+        }
+        with _log_lock:
+            _convert_legacy_log(save_path)
+            with open(log_path, "a") as f:
+                f.write(json.dumps(log_entry) + "\n")
+        print(f" Log entry added to {log_path}")
+    except Exception as e:
+        print(f" Could not write log: {e}")
+    return txid
 
 def create_punishment_psbt(txid, vout, amount, save_path="."):
     """
-    Create, sign, verify, and broadcast a punishment PSBT.
-    Outputs .psbt and .json files.
+    Create a punishment PSBT and queue it to be signed, broadcast, and verified.
+    Outputs .psbt and .json files; call wait_for_punishments() to block until
+    the queued stages have finished.
     """
     pubkey = CPubKey(bytes.fromhex("03" + "00" * 32))
     output_script = CScript([pubkey, OP_CHECKSIG])
-    tx_out = CTxOut(int(amount * 1e8), output_script)
     outpoint = COutPoint(lx(txid), vout)
-    psbt_in = PSBTInput(witness_utxo=tx_out)
 
     outputs = [
-        PSBTOutput(amount=int(amount * 0.9 * 1e8), script_pubkey=output_script),
-        PSBTOutput(amount=int(amount * 0.1 * 1e8), script_pubkey=output_script)
+        CTxOut(int(amount * 0.9 * 1e8), output_script),
+        CTxOut(int(amount * 0.1 * 1e8), output_script)
     ]
 
-    psbt = PSBT(inputs=[psbt_in], outputs=outputs)
-    psbt.inputs[0].utxo = tx_out
-    psbt.tx.vin[0].prevout = outpoint
+    # The spent output's script is unknown here; the signing wallet fills in the UTXO
+    psbt = PSBT(unsigned_tx=CMutableTransaction([CTxIn(outpoint)], outputs))
 
     psbt_b64 = psbt.to_base64()
     filename = f"punishment_{txid}"
@@ -44,58 +177,13 @@ def create_punishment_psbt(txid, vout, amount, save_path="."):
     with open(os.path.join(save_path, filename + ".json"), "w") as f:
         json.dump({"psbt": psbt_b64, "txid": txid, "vout": vout, "amount": amount}, f, indent=2)
 
-    try:
-        signed = subprocess.check_output([
-            "hwi", "--device-path", "/dev/hidraw0", "signtx", "--psbt", psbt_b64
-        ]).decode()
-
-        signed_filename = os.path.join(save_path, filename + "_signed.psbt")
-        with open(signed_filename, "w") as f:
-            f.write(signed)
-
-        # Extract final tx and broadcast
-        final_tx = subprocess.check_output([
-            "hwi", "--device-path", "/dev/hidraw0", "finalizepsbt", "--psbt", signed
-        ]).decode()
-
-        tx_hex = json.loads(final_tx).get("hex")
-        if tx_hex:
-            txid = BITCOIN_RPC.sendrawtransaction(tx_hex)
-            print(f" Broadcasted TXID: {txid}")
-        else:
-            print(" Could not finalize PSBT to hex")
-
-    except Exception as e:
-        print(f" HWI signing or broadcasting failed: {e}")
-
-            # Verify UTXO broadcast
-        try:
-            tx_details = BITCOIN_RPC.getrawtransaction(txid, True)
-            if tx_details:
-                print(f" Verified on-chain UTXO: {txid} with outputs:")
-                for i, vout in enumerate(tx_details['vout']):
-                    print(f"  → Output {i}: {vout['value']} BTC to {vout['scriptPubKey']['address'] if 'address' in vout['scriptPubKey'] else 'script'}")
-        except Exception as e:
-            print(f" Could not verify UTXO on-chain: {e}")
-
-        # Log results
-    try:
-        log_path = os.path.join(save_path, "punishment_log.json")
-        log_entry = {
-            "txid": txid,
-            "timestamp": int(time.time()),
-            "outputs": tx_details.get("vout", [])
-        }
-        if os.path.exists(log_path):
-            with open(log_path, "r") as f:
-                logs = json.load(f)
-        else:
-            logs = []
-        logs.append(log_entry)
-        with open(log_path, "w") as f:
-            json.dump(logs, f, indent=2)
-        print(f" Log entry added to {log_path}")
-    except Exception as e:
-        print(f" Could not write log: {e}")
+    signed_filename = os.path.join(save_path, filename + "_signed.psbt")
+    finalized = _signer.submit(_sign, psbt_b64, signed_filename)
+    broadcast = _then(finalized, _broadcaster, _broadcast)
+    verified = _then(broadcast, _verifier, _verify_and_log, save_path)
+    verified.add_done_callback(_report_failure)
+    with _in_flight_lock:
+        _in_flight.add(verified)
+    verified.add_done_callback(_forget)
 
     return psbt_b64
@@ -0,0 +1,52 @@
+# challenge_psbt.py — Taproot PSBT construction for BitVM challenges
+# Importing this module has no side effects: chain params, keys and the
+# funding outpoint all come from the caller.
+from bitcointx.core import COutPoint, CTxIn, CTxOut, CMutableTransaction, lx
+from bitcointx.core.key import CPubKey, XOnlyPubKey
+from bitcointx.core.script import (
+    CScript, OP_RETURN, TaprootScriptTree, OP_CHECKSIGVERIFY, OP_CHECKSEQUENCEVERIFY,
+    OP_EQUAL, OP_IF, OP_ELSE, OP_ENDIF, OP_SHA256, OP_1,
+)
+from bitcointx.core.psbt import PartiallySignedTransaction
+from bitcointx.wallet import P2TRCoinAddress
+
+
+def step_leaf_scripts(challenger_pub, operator_pub, chain, timeouts) -> list:
+    """
+    One leaf per chain link: challenger signs, then either chain[i+1] hashes to
+    chain[i] or the operator can claim after timeouts[i].
+    """
+    # Only the step data, expected hash and timeout differ between leaves. The
+    # shared parts stay element lists: adding CScripts would push them as data.
+    prefix = [challenger_pub, OP_CHECKSIGVERIFY]
+    suffix = [operator_pub, OP_CHECKSIGVERIFY, OP_ENDIF]
+    return [
+        CScript(prefix + [
+            chain[i+1], OP_SHA256, chain[i], OP_EQUAL, OP_IF,
+                OP_1,
+            OP_ELSE,
+                timeouts[i], OP_CHECKSEQUENCEVERIFY,
+        ] + suffix)
+        for i in range(len(chain) - 1)
+    ]
+
+
+def build_challenge_psbt(leaves, op_return_payload: bytes, *, internal_pub, prev_txid: str,
+                         prev_vout: int, amount_sats: int, fee: int) -> PartiallySignedTransaction:
+    """
+    Build an unsigned PSBT that spends prev_txid:prev_vout into a Taproot output
+    committing to `leaves`, plus an OP_RETURN output carrying op_return_payload.
+    """
+    if len(internal_pub) == 33:  # compressed key, e.g. straight from BITVM_INTERNAL_PUBKEY
+        internal_pub = CPubKey(internal_pub)
+    named = [CScript(leaf, name=f"step_{i}") for i, leaf in enumerate(leaves)]
+    tree = TaprootScriptTree(named, internal_pubkey=XOnlyPubKey(internal_pub))
+    address = P2TRCoinAddress.from_script_tree(tree)
+    tx = CMutableTransaction(
+        [CTxIn(COutPoint(lx(prev_txid), prev_vout))],
+        [
+            CTxOut(amount_sats - fee, address.to_scriptPubKey()),
+            CTxOut(0, CScript([OP_RETURN, op_return_payload])),
+        ]
+    )
+    return PartiallySignedTransaction(unsigned_tx=tx)
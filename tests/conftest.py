@@ -0,0 +1,19 @@
+import ctypes.util
+import sys
+from pathlib import Path
+
+# The modules under test are flat scripts in the repo root
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# bitcointx needs libsecp256k1 for Taproot key tweaks. Without a system copy,
+# fall back to the one bundled with coincurve so the PSBT tests still run.
+if ctypes.util.find_library("secp256k1") is None:
+    try:
+        import bitcointx
+        import coincurve
+    except ImportError:
+        pass
+    else:
+        bundled = sorted(Path(coincurve.__file__).parent.glob("_libsecp256k1*"))
+        if bundled:
+            bitcointx.set_custom_secp256k1_path(str(bundled[0]))
@@ -0,0 +1,157 @@
+from hashlib import sha256
+
+import pytest
+
+
+@pytest.fixture(scope="module")
+def bitvm(tmp_path_factory):
+    # BitVM creates its block directory in the working directory on import
+    mp = pytest.MonkeyPatch()
+    mp.chdir(tmp_path_factory.mktemp("bitvm"))
+    try:
+        import BitVM
+    except ImportError as e:
+        pytest.skip(str(e))
+    yield BitVM
+    mp.undo()
+
+
+def _chain(n):
+    steps = [b"seed"]
+    for _ in range(n):
+        steps.append(sha256(steps[-1]).digest())
+    return tuple(step.hex() for step in steps)
+
+
+def test_valid_chain(bitvm):
+    assert bitvm._first_bad_step(_chain(4)) == -1
+
+
+def test_hash_mismatch_reported_before_later_bad_length(bitvm):
+    s0 = b"seed".hex()
+    assert bitvm._first_bad_step((s0, "00" * 32, "ab")) == 1
+
+
+def test_short_step_is_invalid(bitvm):
+    chain = _chain(3)
+    assert bitvm._first_bad_step(chain[:2] + (chain[2][:62],)) == 2
+
+
+def test_non_hex_step_is_invalid(bitvm):
+    chain = _chain(3)
+    assert bitvm._first_bad_step(chain[:2] + ("zz" * 32,) + chain[3:]) == 2
+
+
+def test_repeated_chain_is_not_walked_again(bitvm, monkeypatch):
+    walks = []
+    walk = bitvm._first_bad_link
+    monkeypatch.setattr(bitvm, "_first_bad_link", lambda raw: walks.append(raw) or walk(raw))
+    chain = list(_chain(5))
+    chain[3] = "11" * 32
+    assert bitvm._first_bad_step(chain) == 3
+    assert bitvm._first_bad_step(tuple(chain)) == 3
+    assert len(walks) == 1
+
+
+def test_block_id_bytes_do_not_depend_on_orjson(bitvm):
+    block = {"b": 1e16, "a": [2 ** 70, "é"]}
+    assert bitvm._canonical(block) == '{"a":[1180591620717411303424,"é"],"b":1e+16}'.encode()
+
+
+@pytest.fixture
+def builder(bitvm, tmp_path):
+    return bitvm.BitVMProofBuilder(db_path=tmp_path)
+
+
+@pytest.fixture
+def hwi_calls(monkeypatch):
+    import subprocess
+    calls = []
+    monkeypatch.setattr(subprocess, "run", lambda args, **kw: calls.append(args))
+    return calls
+
+
+@pytest.mark.parametrize("pubkey, utxo", [
+    ("not hex", {"txid": "9d" * 32, "vout": 1, "amount_sats": 50000}),
+    ("02" + "11" * 32, {"txid": "9d" * 32, "vout": 1}),
+    ("02" + "11" * 32, ["9d" * 32, 1, 50000]),
+])
+def test_bad_psbt_config_is_reported_per_block(bitvm, builder, hwi_calls, monkeypatch, pubkey, utxo):
+    monkeypatch.setattr(bitvm, "CHALLENGE_INTERNAL_PUBKEY", pubkey)
+    for block_id in ("a", "b"):
+        builder._put_block(block_id, {"challenged": True, "step_chain": list(_chain(2)), "challenge_utxo": utxo})
+    builder._process_pending()
+    assert builder.load_block("a")["proof_generated"] and builder.load_block("b")["proof_generated"]
+    assert hwi_calls == []
+
+
+def test_stale_psbt_is_not_signed(bitvm, builder, hwi_calls, monkeypatch):
+    monkeypatch.setattr(bitvm, "CHALLENGE_INTERNAL_PUBKEY", None)
+    (builder.db_path / "rollup_block_a_challenge.psbt").write_bytes(b"old")
+    builder.process_challenge("a", {"challenged": True, "step_chain": list(_chain(2))})
+    assert hwi_calls == []
+
+
+def test_psbt_written_then_signed(bitvm, builder, hwi_calls, monkeypatch):
+    from bitcointx.core.key import CPubKey
+    G = "0279be667ef9dcbbac55a06295ce870b07029bfcdb2dce28d959f2815b16f81798"
+    try:
+        CPubKey(bytes.fromhex(G)).is_fullyvalid()
+    except ImportError as e:  # libsecp256k1 not installed
+        pytest.skip(str(e))
+    monkeypatch.setattr(bitvm, "CHALLENGE_INTERNAL_PUBKEY", G)
+    utxo = {"txid": "9d" * 32, "vout": 1, "amount_sats": 50000}
+    builder.process_challenge("a", {"challenged": True, "step_chain": list(_chain(2)), "challenge_utxo": utxo})
+    assert (builder.db_path / "rollup_block_a_challenge.psbt").exists()
+    assert hwi_calls[0][3] == "signtx"
+
+
+def test_big_ints_survive_store_process_and_export(bitvm, builder, hwi_calls, monkeypatch):
+    monkeypatch.setattr(bitvm, "CHALLENGE_INTERNAL_PUBKEY", None)
+    block_id = builder.store_rollup_block({"challenged": True, "x": 2 ** 70})
+    builder._process_pending()
+    assert builder.load_block(block_id)["x"] == 2 ** 70
+    (path,) = builder.export_json()
+    assert b"1180591620717411303424" in path.read_bytes()
+    data = builder._db.execute("SELECT data FROM blocks WHERE id = ?", (block_id,)).fetchone()[0]
+    assert data == bitvm._canonical(builder.load_block(block_id))
+
+
+def test_hung_bitcoind_times_out(bitvm, builder, monkeypatch):
+    import socket
+    import time
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen()  # accepts connections but never answers
+    url = "http://127.0.0.1:%d" % server.getsockname()[1]
+    monkeypatch.setattr(bitvm, "BITCOIND_RPC_URL", url)
+    monkeypatch.setattr(bitvm, "BITCOIND_TIMEOUT", (0.2, 0.2))
+    start = time.monotonic()
+    try:
+        assert builder.fetch_utxos_many(["addr"]) == {"addr": []}
+    finally:
+        server.close()
+    assert time.monotonic() - start < 5
+
+
+def test_block_marked_challenged_from_another_thread(bitvm, builder, hwi_calls, monkeypatch):
+    import threading
+    monkeypatch.setattr(bitvm, "CHALLENGE_INTERNAL_PUBKEY", None)
+    ids = []
+    worker = threading.Thread(target=lambda: ids.append(builder.store_rollup_block({"step_chain": list(_chain(2))})))
+    worker.start()
+    worker.join()
+    builder._process_pending()
+    assert not builder.load_block(ids[0]).get("proof_generated")
+
+    worker = threading.Thread(target=builder.mark_challenged, args=(ids[0],))
+    worker.start()
+    worker.join()
+    builder._process_pending()
+    block = builder.load_block(ids[0])
+    assert block["challenged"] and block["proof_generated"] and block["proof_verified"]
+
+
+def test_mark_challenged_unknown_block(builder):
+    with pytest.raises(KeyError):
+        builder.mark_challenged("missing")
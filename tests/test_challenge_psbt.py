@@ -0,0 +1,68 @@
+import pytest
+
+pytest.importorskip("bitcointx")
+
+from bitcointx.core.script import CScript, OP_SHA256, OP_EQUAL, OP_RETURN
+
+from challenge_psbt import build_challenge_psbt
+
+# Compressed secp256k1 generator point, a valid public key with no private key in the repo
+G = bytes.fromhex("0279be667ef9dcbbac55a06295ce870b07029bfcdb2dce28d959f2815b16f81798")
+
+
+def _build(**overrides):
+    args = dict(internal_pub=G, prev_txid="9d" * 32, prev_vout=1, amount_sats=50000, fee=1000)
+    args.update(overrides)
+    leaves = [CScript([OP_SHA256, bytes([i]) * 32, OP_EQUAL]) for i in range(3)]
+    try:
+        return build_challenge_psbt(leaves, b"QmTest", **args)
+    except ImportError as e:  # libsecp256k1 not installed
+        pytest.skip(str(e))
+
+
+def test_spends_given_outpoint_and_pays_amount_minus_fee():
+    psbt = _build()
+    tx = psbt.unsigned_tx
+    assert tx.vin[0].prevout.hash[::-1].hex() == "9d" * 32
+    assert tx.vin[0].prevout.n == 1
+    assert tx.vout[0].nValue == 49000
+    assert tx.vout[0].scriptPubKey.is_witness_v1_taproot()
+
+
+def test_op_return_carries_payload():
+    psbt = _build()
+    assert psbt.unsigned_tx.vout[1].scriptPubKey == CScript([OP_RETURN, b"QmTest"])
+
+
+def test_output_depends_on_internal_key():
+    other = bytes.fromhex("02c6047f9441ed7d6d3045406e95c07cd85c778e4b8cef3ca7abac09b95c709ee5")
+    assert _build().unsigned_tx.vout[0] != _build(internal_pub=other).unsigned_tx.vout[0]
+
+
+def test_step_leaves_match_flat_scripts():
+    from hashlib import sha256
+    from bitcointx.core.script import (
+        OP_CHECKSIGVERIFY, OP_CHECKSEQUENCEVERIFY, OP_IF, OP_ELSE, OP_ENDIF, OP_1,
+    )
+    from challenge_psbt import step_leaf_scripts
+
+    challenger, operator = G, bytes.fromhex("03" + "11" * 32)
+    chain = [b"init"]
+    for _ in range(3):
+        chain.insert(0, sha256(chain[0]).digest())
+    timeouts = [80, 160, 240]
+
+    expected = [
+        CScript([
+            challenger, OP_CHECKSIGVERIFY,
+            chain[i+1], OP_SHA256, chain[i], OP_EQUAL, OP_IF,
+                OP_1,
+            OP_ELSE,
+                timeouts[i], OP_CHECKSEQUENCEVERIFY,
+                operator, OP_CHECKSIGVERIFY,
+            OP_ENDIF
+        ])
+        for i in range(3)
+    ]
+    leaves = step_leaf_scripts(challenger, operator, chain, timeouts)
+    assert [bytes(l) for l in leaves] == [bytes(e) for e in expected]
@@ -0,0 +1,97 @@
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+
+import pytest
+
+pytest.importorskip("bitcoin.rpc")
+
+import PSBTlib
+
+
+@pytest.fixture
+def executor():
+    ex = ThreadPoolExecutor(max_workers=1)
+    yield ex
+    ex.shutdown()
+
+
+def test_then_runs_next_stage_with_result(executor):
+    first = Future()
+    chained = PSBTlib._then(first, executor, lambda value, extra: value + extra, 2)
+    first.set_result(1)
+    assert chained.result(timeout=5) == 3
+
+
+def test_then_skips_stage_after_failure(executor):
+    calls = []
+    first = Future()
+    chained = PSBTlib._then(first, executor, calls.append)
+    first.set_exception(ValueError("sign failed"))
+    assert isinstance(chained.exception(timeout=5), ValueError)
+    assert calls == []
+
+
+def test_then_resolves_when_upstream_is_cancelled(executor):
+    first = Future()
+    chained = PSBTlib._then(first, executor, lambda value: value)
+    first.cancel()
+    assert isinstance(chained.exception(timeout=5), CancelledError)
+
+
+def test_then_resolves_when_executor_is_shut_down():
+    ex = ThreadPoolExecutor(max_workers=1)
+    ex.shutdown()
+    first = Future()
+    chained = PSBTlib._then(first, ex, lambda value: value)
+    first.set_result(1)
+    assert isinstance(chained.exception(timeout=5), RuntimeError)
+
+
+@pytest.fixture
+def stages(monkeypatch):
+    """Stub out HWI and bitcoind so the pipeline runs locally."""
+    calls = []
+
+    def sign(psbt_b64, signed_filename):
+        calls.append("sign")
+        return "00" * 10
+
+    def broadcast(tx_hex):
+        calls.append("broadcast")
+        return "ab" * 32
+
+    class Rpc:
+        def getrawtransaction(self, txid, verbose):
+            calls.append("verify")
+            return {"vout": [{"value": 0.001, "scriptPubKey": {}}]}
+
+    monkeypatch.setattr(PSBTlib, "_sign", sign)
+    monkeypatch.setattr(PSBTlib, "_broadcast", broadcast)
+    monkeypatch.setattr(PSBTlib, "_rpc", Rpc)
+    return calls
+
+
+def _create(tmp_path):
+    try:
+        return PSBTlib.create_punishment_psbt("9d" * 32, 0, 0.001, save_path=str(tmp_path))
+    except ImportError as e:  # libsecp256k1 not installed
+        pytest.skip(str(e))
+
+
+def test_wait_for_punishments_covers_every_stage(tmp_path, stages):
+    _create(tmp_path)
+    _create(tmp_path)
+    PSBTlib.wait_for_punishments(timeout=5)
+    assert stages.count("verify") == 2
+    log = PSBTlib.load_punishment_log(str(tmp_path))
+    assert [entry["txid"] for entry in log] == ["ab" * 32] * 2
+
+
+def test_wait_for_punishments_returns_after_failed_signing(tmp_path, stages, monkeypatch):
+    def fail(*args):
+        raise RuntimeError("device not found")
+
+    monkeypatch.setattr(PSBTlib, "_sign", fail)
+    _create(tmp_path)
+    PSBTlib.wait_for_punishments(timeout=5)
+    assert "broadcast" not in stages
+    assert PSBTlib.load_punishment_log(str(tmp_path)) == []